@@ -0,0 +1,5 @@
+from dotenv import load_dotenv
+
+# Load environment variables once for the whole package, before any
+# submodule (e.g. app.get_client) reads them
+load_dotenv()
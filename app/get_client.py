@@ -5,53 +5,109 @@ Supports OpenAI, DeepSeek, and Gemini providers.
 
 import os
 from typing import Literal
+import httpx
 from openai import AsyncOpenAI
 
 
 ClientName = Literal["openai", "deepseek", "gemini"]
 
+# Provider table: client name -> (API key env var, base URL, default model)
+_PROVIDERS: dict[str, tuple[str, str | None, str]] = {
+    "openai": ("OPENAI_API_KEY", None, "gpt-4o-mini"),
+    "deepseek": ("DEEPSEEK_API_KEY", "https://api.deepseek.com", "deepseek-chat"),
+    "gemini": ("GEMINI_API_KEY", "https://generativelanguage.googleapis.com/v1beta/openai/", "gemini-2.5-flash"),
+}
+
+# Provider keys, snapshotted once at import (.env is loaded in app/__init__.py)
+_API_KEYS: dict[str, str | None] = {
+    name: os.getenv(env_var) for name, (env_var, _, _) in _PROVIDERS.items()
+}
+
+# One client per provider, so requests share its HTTP connection pool
+_CLIENTS: dict[str, AsyncOpenAI] = {}
+
+# Client and default model bound together per provider, for request paths
+# that need both
+_PROVIDER_BINDINGS: dict[str, tuple[AsyncOpenAI, str]] = {}
+
+# Connection pool settings for each provider's HTTP client
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=30.0)
+HTTP_TIMEOUT_SECONDS = 120.0
+
 
 def get_client(client_name: ClientName) -> AsyncOpenAI | None:
     """
     Get an AsyncOpenAI client for the specified provider.
 
+    Clients are created once per provider and reused on later calls.
+
     Args:
         client_name: The name of the client to get ("openai", "deepseek", "gemini").
 
     Returns:
         The AsyncOpenAI client configured for the specified provider.
     """
-    # ====> For OpenAI models <====
-    if client_name == "openai":
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY is not set in the environment variables.")
-        return AsyncOpenAI(api_key=api_key)
-
-    # ====> For DeepSeek models <====
-    elif client_name == "deepseek":
-        api_key = os.getenv("DEEPSEEK_API_KEY")
-        if not api_key:
-            raise ValueError("DEEPSEEK_API_KEY is not set in the environment variables.")
-        return AsyncOpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com",
-        )
-
-    # ====> For Google Gemini models <====
-    elif client_name == "gemini":
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY is not set in the environment variables.")
-        return AsyncOpenAI(
-            api_key=api_key,
-            base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
-        )
-
-    else:
+    client = _CLIENTS.get(client_name)
+    if client is None:
+        client = _create_client(client_name)
+        if client is not None:
+            _CLIENTS[client_name] = client
+    return client
+
+
+def _create_client(client_name: ClientName) -> AsyncOpenAI | None:
+    """Construct a new AsyncOpenAI client for the specified provider."""
+    provider = _PROVIDERS.get(client_name)
+    if provider is None:
         print(f"Unsupported client: {client_name}")
         return None
 
+    env_var, base_url, _ = provider
+    api_key = _API_KEYS[client_name]
+    if not api_key:
+        raise ValueError(f"{env_var} is not set in the environment variables.")
+
+    kwargs = {
+        "api_key": api_key,
+        "http_client": httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT_SECONDS),
+    }
+    if base_url:
+        kwargs["base_url"] = base_url
+    return AsyncOpenAI(**kwargs)
+
+
+def get_provider(client_name: ClientName) -> tuple[AsyncOpenAI, str]:
+    """
+    Get the client and default model for the specified provider in one lookup.
+
+    Args:
+        client_name: The name of the client ("openai", "deepseek", "gemini").
+
+    Returns:
+        Tuple of (AsyncOpenAI client, default model name).
+    """
+    provider = _PROVIDER_BINDINGS.get(client_name)
+    if provider is None:
+        provider = (get_client(client_name), get_model_for_client(client_name))
+        if provider[0] is not None:
+            _PROVIDER_BINDINGS[client_name] = provider
+    return provider
+
+
+def warm_clients() -> None:
+    """Create clients and (client, model) bindings for every provider whose API key is set."""
+    for client_name, api_key in _API_KEYS.items():
+        if api_key:
+            get_provider(client_name)
+
+
+async def close_clients() -> None:
+    """Close all cached clients and their connection pools."""
+    _PROVIDER_BINDINGS.clear()
+    while _CLIENTS:
+        _, client = _CLIENTS.popitem()
+        await client.close()
+
 
 def get_model_for_client(client_name: ClientName) -> str:
     """
@@ -63,9 +119,5 @@ def get_model_for_client(client_name: ClientName) -> str:
     Returns:
         The default model name for the client.
     """
-    models = {
-        "openai": "gpt-4o-mini",
-        "deepseek": "deepseek-chat",
-        "gemini": "gemini-2.5-flash",
-    }
-    return models.get(client_name, "gpt-4o-mini")
+    provider = _PROVIDERS.get(client_name, _PROVIDERS["openai"])
+    return provider[2]
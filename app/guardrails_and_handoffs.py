@@ -4,22 +4,136 @@ Demonstrates simple input/output guardrails and agent handoffs.
 """
 
 import asyncio
+import hashlib
+import logging
 import re
+from functools import lru_cache
 from typing import Optional
-from dotenv import load_dotenv
 from agents import Agent, Runner, set_default_openai_client, InputGuardrail, OutputGuardrail, GuardrailFunctionOutput
 from pydantic import BaseModel
 
-from app.get_client import ClientName, get_client, get_model_for_client
+from app.cache import LRUCache
+from app.get_client import ClientName, get_model_for_client, get_provider
 
-# Load environment variables
-load_dotenv(override=True)
+logger = logging.getLogger(__name__)
+
+
+# Guardrail patterns, fused into one alternation per check and compiled once at
+# import so each guardrail call scans the text in a single pass.
+_UNSAFE_INPUT_PATTERNS = (
+    r'\b(hack|exploit|attack|malware|virus)\b',
+    r'\b(steal|leak|bypass)\b.*\b(data|password|system)\b',
+    r'\b(illegal|harmful)\b.*\b(activity|content)\b',
+)
+
+_HARMFUL_OUTPUT_PATTERNS = (
+    r'\b(how to|guide|instructions).*(harm|hurt|attack)\b',
+    r'\b(illegal|unlawful).*(activity|method)\b',
+)
+
+# Every pattern above requires one of these literals, so text containing none
+# of them can skip the regex entirely (plain substring search is memchr-fast)
+_UNSAFE_INPUT_KEYWORDS = (
+    "hack", "exploit", "attack", "malware", "virus",
+    "steal", "leak", "bypass", "illegal", "harmful",
+)
+
+_HARMFUL_OUTPUT_KEYWORDS = ("how to", "guide", "instructions", "illegal", "unlawful")
+
+# Characters that re.IGNORECASE still matches to ASCII letters after
+# str.lower(), mapped to those letters so the prefilter never skips text the
+# case-insensitive regex would flag (e.g. "ſteal", with a long s)
+_KEYWORD_FOLD = str.maketrans({"\u0131": "i", "\u017f": "s"})
+
+_UNSAFE_INPUT_RE = re.compile("|".join(f"(?:{p})" for p in _UNSAFE_INPUT_PATTERNS), re.IGNORECASE)
+_HARMFUL_OUTPUT_RE = re.compile("|".join(f"(?:{p})" for p in _HARMFUL_OUTPUT_PATTERNS), re.IGNORECASE)
+
+
+def _has_keyword(content_lower: str, keywords: tuple[str, ...]) -> bool:
+    """Check whether lowercased text contains any of the trigger keywords."""
+    folded = content_lower.translate(_KEYWORD_FOLD)
+    return any(k in folded for k in keywords)
+
+
+# Keyword routing for the manual (non-OpenAI) path and for labelling OpenAI
+# responses, checked in priority order: first matching specialist wins.
+# Keywords match at word starts and allow inflected forms ("mathematics",
+# "solving", "calculations"); "ai" must be a whole word so "said" does not match
+_INPUT_ROUTE_PATTERNS = (
+    ("Math Tutor", re.compile(r"(?i)\b(?:math\w*|equations?|solv\w*|calculat\w*|algebra\w*)")),
+    ("AI Expert", re.compile(r"(?i)\b(?:ai|machine learning|neural\w*|artificial intelligence)\b")),
+    ("Business Specialist", re.compile(r"(?i)\b(?:business\w*|marketing|strateg\w*|financ\w*)")),
+)
+
+_OUTPUT_ROUTE_PATTERNS = (
+    ("Math Tutor", re.compile(r"(?i)\b(?:math\w*|equations?|calculat\w*|solv\w*)")),
+    ("AI Expert", re.compile(r"(?i)\b(?:ai|machine learning|neural\w*|models?)\b")),
+    ("Business Specialist", re.compile(r"(?i)\b(?:business\w*|strateg\w*|marketing|financ\w*)")),
+)
+
+
+def _match_route(text: str, routes) -> Optional[str]:
+    """Return the name of the first route whose pattern matches the text."""
+    for name, pattern in routes:
+        if pattern.search(text):
+            return name
+    return None
+
+
+def _stripped_len_at_least(text: str, n: int) -> bool:
+    """Check len(text.strip()) >= n without allocating the stripped copy."""
+    if len(text) < n:
+        return False
+    start, end = 0, len(text)
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return end - start >= n
 
 
 # ============================================================================
 # INPUT GUARDRAIL - Single simple function
 # ============================================================================
 
+# Input verdicts for repeated prompts, keyed on a fixed-size digest of the text
+# so large inputs are not kept alive by the cache
+GUARDRAIL_CACHE_SIZE = 4096
+_input_verdicts = LRUCache(maxsize=GUARDRAIL_CACHE_SIZE)
+
+
+def _classify_input(input_data: str) -> tuple[bool, str]:
+    """
+    Classify input as safe or unsafe.
+
+    Pure function of the text, so verdicts are cached for repeated inputs.
+
+    Returns:
+        Tuple of (is_safe, reason)
+    """
+    key = hashlib.blake2b(input_data.encode(), digest_size=16).digest()
+    verdict = _input_verdicts.get(key)
+    if verdict is None:
+        verdict = _classify_input_uncached(input_data)
+        _input_verdicts.set(key, verdict)
+    return verdict
+
+
+def _classify_input_uncached(input_data: str) -> tuple[bool, str]:
+    """Run the input safety checks on the text."""
+    # Check if empty
+    if not input_data or input_data.isspace():
+        return False, "Input cannot be empty."
+
+    # Check for unsafe patterns, skipping the regex when no trigger keyword appears
+    content_lower = input_data.lower()
+    if _has_keyword(content_lower, _UNSAFE_INPUT_KEYWORDS) and _UNSAFE_INPUT_RE.search(content_lower):
+        return False, "Input contains unsafe content and cannot be processed."
+
+    # Input is safe
+    return True, "Input passed safety checks."
+
+
 async def check_unsafe_content(ctx, agent, input_data: str):
     """
     Check if input contains unsafe or inappropriate content.
@@ -32,34 +146,10 @@ async def check_unsafe_content(ctx, agent, input_data: str):
     Returns:
         GuardrailFunctionOutput with tripwire_triggered flag
     """
-    # Check for prohibited patterns
-    unsafe_patterns = [
-        r'\b(hack|exploit|attack|malware|virus)\b',
-        r'\b(steal|leak|bypass)\b.*\b(data|password|system)\b',
-        r'\b(illegal|harmful)\b.*\b(activity|content)\b',
-    ]
-
-    content_lower = input_data.lower()
-
-    # Check if empty
-    if len(input_data.strip()) == 0:
-        return GuardrailFunctionOutput(
-            output_info={"is_safe": False, "reason": "Input cannot be empty."},
-            tripwire_triggered=True,
-        )
-
-    # Check for unsafe patterns
-    for pattern in unsafe_patterns:
-        if re.search(pattern, content_lower, re.IGNORECASE):
-            return GuardrailFunctionOutput(
-                output_info={"is_safe": False, "reason": "Input contains unsafe content and cannot be processed."},
-                tripwire_triggered=True,
-            )
-
-    # Input is safe
+    is_safe, reason = _classify_input(input_data)
     return GuardrailFunctionOutput(
-        output_info={"is_safe": True, "reason": "Input passed safety checks."},
-        tripwire_triggered=False,
+        output_info={"is_safe": is_safe, "reason": reason},
+        tripwire_triggered=not is_safe,
     )
 
 
@@ -67,6 +157,26 @@ async def check_unsafe_content(ctx, agent, input_data: str):
 # OUTPUT GUARDRAIL - Single simple function
 # ============================================================================
 
+def _classify_output(output_data: str) -> tuple[bool, str]:
+    """
+    Classify output as safe or harmful.
+
+    Returns:
+        Tuple of (is_safe, reason)
+    """
+    # Check if output is too short
+    if not _stripped_len_at_least(output_data, 10):
+        return False, "Output is too short or empty."
+
+    # Check for harmful patterns, skipping the regex when no trigger keyword appears
+    content_lower = output_data.lower()
+    if _has_keyword(content_lower, _HARMFUL_OUTPUT_KEYWORDS) and _HARMFUL_OUTPUT_RE.search(content_lower):
+        return False, "Output contains potentially harmful content."
+
+    # Output is safe
+    return True, "Output passed safety checks."
+
+
 async def check_unsafe_output(ctx, agent, output_data: str):
     """
     Check if output contains harmful or inappropriate content.
@@ -79,33 +189,10 @@ async def check_unsafe_output(ctx, agent, output_data: str):
     Returns:
         GuardrailFunctionOutput with tripwire_triggered flag
     """
-    # Check for harmful content in output
-    harmful_patterns = [
-        r'\b(how to|guide|instructions).*(harm|hurt|attack)\b',
-        r'\b(illegal|unlawful).*(activity|method)\b',
-    ]
-
-    content_lower = output_data.lower()
-
-    # Check if output is too short
-    if len(output_data.strip()) < 10:
-        return GuardrailFunctionOutput(
-            output_info={"is_safe": False, "reason": "Output is too short or empty."},
-            tripwire_triggered=True,
-        )
-
-    # Check for harmful patterns
-    for pattern in harmful_patterns:
-        if re.search(pattern, content_lower, re.IGNORECASE):
-            return GuardrailFunctionOutput(
-                output_info={"is_safe": False, "reason": "Output contains potentially harmful content."},
-                tripwire_triggered=True,
-            )
-
-    # Output is safe
+    is_safe, reason = _classify_output(output_data)
     return GuardrailFunctionOutput(
-        output_info={"is_safe": True, "reason": "Output passed safety checks."},
-        tripwire_triggered=False,
+        output_info={"is_safe": is_safe, "reason": reason},
+        tripwire_triggered=not is_safe,
     )
 
 
@@ -113,6 +200,7 @@ async def check_unsafe_output(ctx, agent, output_data: str):
 # SPECIALIZED AGENTS
 # ============================================================================
 
+@lru_cache(maxsize=4)
 def create_math_tutor_agent(client_name: ClientName = "openai") -> Agent:
     """Create a Math Tutor agent."""
     model = get_model_for_client(client_name)
@@ -126,6 +214,7 @@ def create_math_tutor_agent(client_name: ClientName = "openai") -> Agent:
     return agent
 
 
+@lru_cache(maxsize=4)
 def create_ai_expert_agent(client_name: ClientName = "openai") -> Agent:
     """Create an AI Expert agent."""
     model = get_model_for_client(client_name)
@@ -139,6 +228,7 @@ def create_ai_expert_agent(client_name: ClientName = "openai") -> Agent:
     return agent
 
 
+@lru_cache(maxsize=4)
 def create_business_specialist_agent(client_name: ClientName = "openai") -> Agent:
     """Create a Business Specialist agent."""
     model = get_model_for_client(client_name)
@@ -152,9 +242,13 @@ def create_business_specialist_agent(client_name: ClientName = "openai") -> Agen
     return agent
 
 
+@lru_cache(maxsize=4)
 def create_triage_agent_with_handoffs(client_name: ClientName = "openai") -> Agent:
     """
     Create a triage agent with handoffs to specialized agents.
+
+    Agents are fixed configuration, so each factory is cached per client and
+    the same instances are reused across requests.
     """
     model = get_model_for_client(client_name)
 
@@ -177,10 +271,38 @@ def create_triage_agent_with_handoffs(client_name: ClientName = "openai") -> Age
     return triage_agent
 
 
+_SPECIALIST_FACTORIES = {
+    "Math Tutor": create_math_tutor_agent,
+    "AI Expert": create_ai_expert_agent,
+    "Business Specialist": create_business_specialist_agent,
+}
+
+# System message per specialist for the manual (non-OpenAI) path, built once
+# and shared across requests since the instructions never change
+_SYSTEM_MSGS: dict[str, dict] = {}
+
+
 # ============================================================================
 # MAIN PROCESSING FUNCTION
 # ============================================================================
 
+# Successful results for repeated prompts, so they skip the LLM round trip
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL_SECONDS = 3600
+_response_cache = LRUCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL_SECONDS)
+
+
+def _response_cache_key(client_name: ClientName, model: str, user_input: str) -> tuple:
+    """
+    Build the response cache key for a prompt.
+
+    The input is normalized (trimmed, lowercased) and hashed to keep keys small.
+    Agent instructions are fixed per client and model, so they need no slot.
+    """
+    digest = hashlib.blake2b(user_input.strip().lower().encode(), digest_size=16).digest()
+    return (client_name, model, digest)
+
+
 class HandoffResult(BaseModel):
     """Result of agent handoff process."""
     success: bool
@@ -206,12 +328,14 @@ async def process_with_guardrails_and_handoffs(
     5. Return result
     """
     try:
-        print("\n" + "="*60)
-        print(f"Processing: {user_input}")
-        print("="*60)
+        logger.debug("Processing: %s", user_input)
 
-        # Setup client
-        client = get_client(client_name)
+        client, model = get_provider(client_name)
+        cache_key = _response_cache_key(client_name, model, user_input)
+        cached = _response_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Served from response cache")
+            return cached
 
         # For OpenAI, use the full Agents SDK with automatic guardrails
         if client_name == "openai":
@@ -220,28 +344,19 @@ async def process_with_guardrails_and_handoffs(
             # Create triage agent with handoffs and guardrails
             triage_agent = create_triage_agent_with_handoffs(client_name)
 
-            print("\n[Running Triage Agent with Handoffs...]")
+            logger.debug("Running Triage Agent with Handoffs")
             result = await Runner.run(triage_agent, user_input)
 
-            print(f"\n[Result Received]")
-            print(f"Final Output: {result.final_output}")
+            logger.debug("Final Output: %s", result.final_output)
 
             # Determine which agent handled it
             routed_to = "Unknown"
             if hasattr(result, 'agent_name'):
                 routed_to = result.agent_name
             else:
-                response_lower = result.final_output.lower()
-                if any(word in response_lower for word in ['math', 'equation', 'calculate', 'solve']):
-                    routed_to = "Math Tutor"
-                elif any(word in response_lower for word in ['ai', 'machine learning', 'neural', 'model']):
-                    routed_to = "AI Expert"
-                elif any(word in response_lower for word in ['business', 'strategy', 'marketing', 'finance']):
-                    routed_to = "Business Specialist"
-                else:
-                    routed_to = "Triage Agent"
+                routed_to = _match_route(result.final_output, _OUTPUT_ROUTE_PATTERNS) or "Triage Agent"
 
-            return HandoffResult(
+            handoff_result = HandoffResult(
                 success=True,
                 routed_to=routed_to,
                 final_response=result.final_output,
@@ -249,13 +364,15 @@ async def process_with_guardrails_and_handoffs(
                 warnings=[],
                 errors=[]
             )
+            _response_cache.set(cache_key, handoff_result)
+            return handoff_result
 
         # For DeepSeek and Gemini, use direct API with manual guardrails
         else:
-            print("\n[Step 1: Input Guardrail Check]")
+            logger.debug("Step 1: Input Guardrail Check")
             input_check = await check_unsafe_content(None, None, user_input)
             if input_check.tripwire_triggered:
-                print(f"✗ Input blocked: {input_check.output_info['reason']}")
+                logger.debug("Input blocked: %s", input_check.output_info['reason'])
                 return HandoffResult(
                     success=False,
                     routed_to="blocked",
@@ -264,42 +381,32 @@ async def process_with_guardrails_and_handoffs(
                     warnings=[],
                     errors=[input_check.output_info['reason']]
                 )
-            print("✓ Input passed guardrail")
-
-            print("\n[Step 2: Route to Specialist]")
-            model = get_model_for_client(client_name)
-            user_input_lower = user_input.lower()
-
-            if any(word in user_input_lower for word in ['math', 'equation', 'solve', 'calculate', 'algebra']):
-                specialist = create_math_tutor_agent(client_name)
-                routed_to = "Math Tutor"
-            elif any(word in user_input_lower for word in ['ai', 'machine learning', 'neural', 'artificial intelligence']):
-                specialist = create_ai_expert_agent(client_name)
-                routed_to = "AI Expert"
-            elif any(word in user_input_lower for word in ['business', 'marketing', 'strategy', 'finance']):
-                specialist = create_business_specialist_agent(client_name)
-                routed_to = "Business Specialist"
-            else:
-                specialist = create_ai_expert_agent(client_name)
-                routed_to = "AI Expert"
+            logger.debug("Input passed guardrail")
+
+            logger.debug("Step 2: Route to Specialist")
+            routed_to = _match_route(user_input, _INPUT_ROUTE_PATTERNS) or "AI Expert"
+            specialist = _SPECIALIST_FACTORIES[routed_to](client_name)
 
-            print(f"✓ Routed to: {routed_to}")
+            system_msg = _SYSTEM_MSGS.get(routed_to)
+            if system_msg is None:
+                system_msg = _SYSTEM_MSGS[routed_to] = {"role": "system", "content": specialist.instructions}
+            logger.debug("Routed to: %s", routed_to)
 
-            print("\n[Step 3: Process Request]")
+            logger.debug("Step 3: Process Request")
             response = await client.chat.completions.create(
                 model=model,
                 messages=[
-                    {"role": "system", "content": specialist.instructions},
+                    system_msg,
                     {"role": "user", "content": user_input}
                 ]
             )
             final_output = response.choices[0].message.content
-            print(f"✓ Response received")
+            logger.debug("Response received")
 
-            print("\n[Step 4: Output Guardrail Check]")
+            logger.debug("Step 4: Output Guardrail Check")
             output_check = await check_unsafe_output(None, None, final_output)
             if output_check.tripwire_triggered:
-                print(f"✗ Output blocked: {output_check.output_info['reason']}")
+                logger.debug("Output blocked: %s", output_check.output_info['reason'])
                 return HandoffResult(
                     success=False,
                     routed_to=routed_to,
@@ -308,9 +415,9 @@ async def process_with_guardrails_and_handoffs(
                     warnings=[],
                     errors=[output_check.output_info['reason']]
                 )
-            print("✓ Output passed guardrail")
+            logger.debug("Output passed guardrail")
 
-            return HandoffResult(
+            handoff_result = HandoffResult(
                 success=True,
                 routed_to=routed_to,
                 final_response=final_output,
@@ -318,15 +425,15 @@ async def process_with_guardrails_and_handoffs(
                 warnings=[],
                 errors=[]
             )
+            _response_cache.set(cache_key, handoff_result)
+            return handoff_result
 
     except Exception as e:
-        print(f"\n[Error]: {str(e)}")
-        import traceback
-        traceback.print_exc()
-
         # Check if it's a guardrail error
         error_msg = str(e)
         if "guardrail" in error_msg.lower() or "unsafe" in error_msg.lower():
+            # Expected outcome, so no stack trace
+            logger.warning("Request blocked by guardrail: %s", error_msg)
             return HandoffResult(
                 success=False,
                 routed_to="blocked",
@@ -336,6 +443,7 @@ async def process_with_guardrails_and_handoffs(
                 errors=[error_msg]
             )
 
+        logger.exception("process_with_guardrails_and_handoffs failed")
         return HandoffResult(
             success=False,
             routed_to="error",
@@ -346,5 +454,34 @@ async def process_with_guardrails_and_handoffs(
         )
 
 
+# Limits for batch processing: inputs per request, and how many of a batch's
+# inputs run at once so one batch cannot flood the provider
+MAX_BATCH_SIZE = 32
+BATCH_CONCURRENCY = 8
+
+
+async def process_batch_with_guardrails_and_handoffs(
+    user_inputs: list[str],
+    client_name: ClientName = "openai"
+) -> list[HandoffResult]:
+    """
+    Process several independent inputs concurrently.
+
+    Each input runs the same guardrail/handoff flow as
+    process_with_guardrails_and_handoffs; only the LLM calls of different
+    inputs overlap, at most BATCH_CONCURRENCY at a time.
+
+    Returns:
+        One HandoffResult per input, in the same order
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def process_one(user_input: str) -> HandoffResult:
+        async with semaphore:
+            return await process_with_guardrails_and_handoffs(user_input, client_name)
+
+    return await asyncio.gather(*(process_one(user_input) for user_input in user_inputs))
+
+
 if __name__ == "__main__":
     asyncio.run(demo_guardrails_and_handoffs())
@@ -4,14 +4,14 @@ Demonstrates basic agent creation, execution, and tracing.
 """
 
 import asyncio
-from dotenv import load_dotenv
+import logging
+from functools import lru_cache
 from agents import Agent, Runner, set_default_openai_client, trace
 from pydantic import BaseModel
 
-from app.get_client import ClientName, get_client, get_model_for_client
+from app.get_client import ClientName, get_client, get_model_for_client, get_provider
 
-# Load environment variables
-load_dotenv(override=True)
+logger = logging.getLogger(__name__)
 
 
 class SimpleRunResult(BaseModel):
@@ -23,8 +23,9 @@ class SimpleRunResult(BaseModel):
         arbitrary_types_allowed = True
 
 
+@lru_cache(maxsize=4)
 def create_agent(client_name: ClientName = "openai"):
-    """Create a history agent with the specified client."""
+    """Create a history agent with the specified client (cached per client)."""
     model = get_model_for_client(client_name)
     agent = Agent(
         name="History Agent",
@@ -37,22 +38,21 @@ def create_agent(client_name: ClientName = "openai"):
 async def run_agent_basic(agent: Agent, prompt: str, client_name: ClientName = "openai"):
     """Run the agent with a prompt and display results."""
     # Get and set the client for this provider
-    client = get_client(client_name)
+    client, model = get_provider(client_name)
 
     # For OpenAI, use the Agents SDK which requires the /responses endpoint
     if client_name == "openai":
         set_default_openai_client(client)
         results = await Runner.run(agent, prompt)
-        print("Full Results:")
-        print(results)
-        print("\nFinal Output:")
-        print(results.final_output)
+        # Skip building the (large) results repr unless debug logging is on
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Full Results: %s", results)
+            logger.debug("Final Output: %s", results.final_output)
         return results
 
     # For DeepSeek and Gemini, use direct chat completions API
     # They don't support the /responses endpoint used by Agents SDK
     else:
-        model = get_model_for_client(client_name)
         response = await client.chat.completions.create(
             model=model,
             messages=[
@@ -62,10 +62,7 @@ async def run_agent_basic(agent: Agent, prompt: str, client_name: ClientName = "
         )
 
         final_output = response.choices[0].message.content
-        print("Full Results:")
-        print(f"Response from {client_name}")
-        print("\nFinal Output:")
-        print(final_output)
+        logger.debug("Response from %s, Final Output: %s", client_name, final_output)
 
         # Create a compatible result object
         results = SimpleRunResult(
@@ -78,7 +75,7 @@ async def run_agent_basic(agent: Agent, prompt: str, client_name: ClientName = "
 async def run_agent_with_trace(agent: Agent, prompt: str, client_name: ClientName = "openai"):
     """Run the agent with tracing enabled (OpenAI only)."""
     if client_name != "openai":
-        print(f"Warning: Tracing only supported for OpenAI. Falling back to basic run for {client_name}")
+        logger.warning("Tracing only supported for OpenAI. Falling back to basic run for %s", client_name)
         return await run_agent_basic(agent, prompt, client_name)
 
     client = get_client(client_name)
@@ -86,7 +83,7 @@ async def run_agent_with_trace(agent: Agent, prompt: str, client_name: ClientNam
 
     with trace("Answering question"):
         results = await Runner.run(agent, prompt)
-        print(results.final_output)
+        logger.debug("Final Output: %s", results.final_output)
     return results
 
 
@@ -101,11 +98,13 @@ async def main():
 
     # Run the agent with a basic prompt
     print("\n--- Basic Agent Run ---")
-    await run_agent_basic(agent, "Tell me about World War 2.", client_name)
+    results = await run_agent_basic(agent, "Tell me about World War 2.", client_name)
+    print(results.final_output)
 
     # Run with tracing
     print("\n--- Traced Agent Run ---")
-    await run_agent_with_trace(agent, "Who won the 2022 FIFA World Cup?", client_name)
+    results = await run_agent_with_trace(agent, "Who won the 2022 FIFA World Cup?", client_name)
+    print(results.final_output)
 
 
 if __name__ == "__main__":
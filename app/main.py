@@ -1,17 +1,51 @@
+import asyncio
+import logging
+import logging.handlers
+import queue
+from contextlib import asynccontextmanager
 from typing import Literal, Any, Dict
+import orjson
+from agents.usage import Usage
 from fastapi import FastAPI, Query, Body
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from openai.types import CompletionUsage
 from pydantic import BaseModel
 from app.intro_to_openai_agent import create_agent, run_agent_basic
-from app.get_client import ClientName
-from app.guardrails_and_handoffs import process_with_guardrails_and_handoffs, HandoffResult
-from app.survey_generator import generate_survey, SurveyResponse
-from chat_app.api.routes import router as chat_router
+from app.get_client import ClientName, close_clients, warm_clients
+from app.guardrails_and_handoffs import (
+    process_with_guardrails_and_handoffs,
+    process_batch_with_guardrails_and_handoffs,
+    HandoffResult,
+    MAX_BATCH_SIZE,
+)
+from app.survey_generator import generate_survey, stream_survey, SurveyResponse
+from chat_app.api.routes import router as chat_router, initialize_agents
+
+logger = logging.getLogger(__name__)
 
 
 class TokenUsage(BaseModel):
     input_tokens: int
     output_tokens: int
     total_tokens: int
+    cached_tokens: int | None = None
+
+
+def _extract_usage(usage: Usage | CompletionUsage) -> TokenUsage:
+    """Build TokenUsage from Agents SDK usage or Chat Completions usage."""
+    if isinstance(usage, Usage):
+        return TokenUsage(
+            input_tokens=usage.input_tokens,
+            output_tokens=usage.output_tokens,
+            total_tokens=usage.total_tokens,
+            cached_tokens=getattr(getattr(usage, "input_tokens_details", None), "cached_tokens", 0),
+        )
+    return TokenUsage(
+        input_tokens=usage.prompt_tokens,
+        output_tokens=usage.completion_tokens,
+        total_tokens=usage.total_tokens,
+        cached_tokens=getattr(usage.prompt_tokens_details, "cached_tokens", 0),
+    )
 
 
 class IntroOpenAIResponse(BaseModel):
@@ -22,12 +56,64 @@ class IntroOpenAIResponse(BaseModel):
     token_usage: TokenUsage | None = None
 
 
+def _start_log_listener() -> tuple[logging.Handler, logging.handlers.QueueListener]:
+    """
+    Route root logging through a queue drained by a background thread.
+
+    Handlers on the event loop only enqueue records; the listener thread does
+    the blocking stream writes.
+    """
+    log_queue: queue.Queue = queue.Queue(-1)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Records are fully formatted by the stream handler; keep only the message here
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    # Levels are left to the server's configuration (uvicorn --log-level)
+    logging.getLogger().addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    return queue_handler, listener
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_handler, log_listener = _start_log_listener()
+    try:
+        # Run new tasks eagerly until their first real suspension, so handlers that
+        # finish without blocking (cache hits, health checks) skip a loop iteration
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
+        # Open provider connection pools and bind (client, model) per provider
+        # before the first request
+        warm_clients()
+
+        # Build the chat agents once, so chat requests never check for them
+        try:
+            initialize_agents()
+        except ValueError as e:
+            # The other endpoints can still serve non-OpenAI providers
+            logger.warning("Chat agents not initialized: %s", e)
+        yield
+    finally:
+        # Release pooled provider connections and the log thread even if
+        # startup or shutdown fails
+        try:
+            await close_clients()
+        finally:
+            log_listener.stop()
+            logging.getLogger().removeHandler(log_handler)
+
+
 app = FastAPI(
     title="Agentic AI API",
     description="API for Agentic AI with OpenAI Agent SDK integration",
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Include chat module routes
@@ -41,7 +127,9 @@ async def root():
         "endpoints": {
             "intro_openai": "/intro-openai",
             "guardrails_handoffs": "/guardrails-handoffs",
+            "guardrails_handoffs_batch": "/guardrails-handoffs/batch",
             "generate_survey": "/generate-survey",
+            "generate_survey_stream": "/generate-survey/stream",
             "multi_agent_chat": "/api/chat/message",
             "docs": "/docs"
         }
@@ -80,26 +168,28 @@ async def intro_openai(
         if results.raw_responses:
             response = results.raw_responses[-1]
             # Check if it's an OpenAI Agents SDK response or direct API response
-            if hasattr(response, 'usage') and response.usage:
-                usage = response.usage
-                # Handle both Agent SDK format and standard OpenAI format
-                token_usage = TokenUsage(
-                    input_tokens=getattr(usage, 'input_tokens', getattr(usage, 'prompt_tokens', 0)),
-                    output_tokens=getattr(usage, 'output_tokens', getattr(usage, 'completion_tokens', 0)),
-                    total_tokens=getattr(usage, 'total_tokens', 0),
-                )
-
-        return IntroOpenAIResponse(
+            usage = getattr(response, 'usage', None)
+            if usage:
+                token_usage = _extract_usage(usage)
+
+        result = IntroOpenAIResponse(
             message="Agent executed successfully",
             prompt=prompt,
             client=client,
             agent_response=results.final_output,
             token_usage=token_usage,
         )
+    # Error responses are built from trusted values, so skip validation
     except ValueError as e:
-        return IntroOpenAIResponse(message=str(e), prompt=prompt, client=client, agent_response=None)
+        result = IntroOpenAIResponse.model_construct(
+            message=str(e), prompt=prompt, client=client, agent_response=None, token_usage=None
+        )
     except Exception as e:
-        return IntroOpenAIResponse(message=f"Error: {str(e)}", prompt=prompt, client=client, agent_response=None)
+        result = IntroOpenAIResponse.model_construct(
+            message=f"Error: {str(e)}", prompt=prompt, client=client, agent_response=None, token_usage=None
+        )
+    # Already a validated model, so skip response_model re-validation
+    return ORJSONResponse(result.model_dump())
 
 
 @app.post(
@@ -119,19 +209,36 @@ async def guardrails_handoffs(
     """
     try:
         result = await process_with_guardrails_and_handoffs(user_input, client)
-        return result
     except Exception as e:
-        import traceback
-        print(f"Exception: {str(e)}")
-        print(traceback.format_exc())
-        return HandoffResult(
+        logger.exception("guardrails_handoffs failed")
+        result = HandoffResult.model_construct(
             success=False,
             routed_to="error",
             final_response="",
-            input_guardrail_passed=False,
-            output_guardrail_passed=False,
+            guardrail_passed=False,
+            warnings=[],
             errors=[f"Error: {str(e)}"]
         )
+    return ORJSONResponse(result.model_dump())
+
+
+@app.post(
+    "/guardrails-handoffs/batch",
+    summary="Batch Guardrails and Agent Handoffs",
+    description="Process several independent inputs concurrently with guardrails and agent handoffs",
+    response_model=list[HandoffResult],
+)
+async def guardrails_handoffs_batch(
+    user_inputs: list[str] = Body(
+        ..., description="The user inputs to process", embed=True, max_length=MAX_BATCH_SIZE
+    ),
+    client: Literal["openai", "deepseek", "gemini"] = Body("openai", description="The AI provider to use"),
+):
+    """
+    Process a batch of user inputs, returning one result per input in order.
+    """
+    results = await process_batch_with_guardrails_and_handoffs(user_inputs, client)
+    return ORJSONResponse([result.model_dump() for result in results])
 
 
 @app.post(
@@ -166,12 +273,38 @@ async def generate_survey_endpoint(
     """
     try:
         result = await generate_survey(user_request, existing_form_data, client)
-        return result
     except Exception as e:
-        import traceback
-        print(f"Exception: {str(e)}")
-        print(traceback.format_exc())
-        return SurveyResponse(
+        logger.exception("generate_survey_endpoint failed")
+        result = SurveyResponse.model_construct(
             message=f"Error generating survey: {str(e)}",
             form_data=[]
         )
+    return ORJSONResponse(result.model_dump())
+
+
+@app.post(
+    "/generate-survey/stream",
+    summary="Generate Survey Form (Streaming)",
+    description="Generate survey JSON, streaming each form field as NDJSON as soon as it is generated",
+)
+async def generate_survey_stream_endpoint(
+    user_request: str = Body(..., description="Natural language description of survey fields", embed=True),
+    existing_form_data: list[Dict[str, Any]] | None = Body(None, description="Optional existing form data to modify"),
+    client: Literal["openai", "deepseek", "gemini"] = Body("openai", description="The AI provider to use"),
+):
+    """
+    Stream survey generation as newline-delimited JSON.
+
+    Emits one `{"type": "field", "field": {...}}` line per form_data item as it
+    completes, then a final `{"type": "done", "message": "..."}` line. Failures
+    are reported as a `{"type": "error", "message": "..."}` line.
+    """
+    async def events():
+        try:
+            async for line in stream_survey(user_request, existing_form_data, client):
+                yield line
+        except Exception as e:
+            logger.exception("generate_survey_stream_endpoint failed")
+            yield orjson.dumps({"type": "error", "message": f"Error generating survey: {str(e)}"}) + b"\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
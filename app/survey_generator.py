@@ -4,44 +4,33 @@ Generates structured survey JSON based on user requirements.
 """
 
 import asyncio
-import json
-from typing import Any, Dict
-from dotenv import load_dotenv
+import hashlib
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict
+import ijson
+import orjson
 from agents import Agent, Runner, set_default_openai_client
 from pydantic import BaseModel
 
-from app.get_client import ClientName, get_client, get_model_for_client
+from app.cache import LRUCache
+from app.get_client import ClientName, get_model_for_client, get_provider
 
-# Load environment variables
-load_dotenv(override=True)
 
-
-class SurveyResponse(BaseModel):
-    """Structured response for survey generation."""
-    message: str
-    form_data: list[Dict[str, Any]]
-
-
-def create_survey_agent(client_name: ClientName = "openai") -> Agent:
-    """
-    Create a survey generator agent with detailed instructions.
-    """
-    model = get_model_for_client(client_name)
-
-    # Optimized system prompt
-    instructions = f"""Survey JSON Generator - Return ONLY valid JSON: {{"message": "...", "form_data": [...]}}
+# Survey generator system prompt. Built once and kept byte-identical across
+# requests so provider-side prompt caching can reuse it.
+SURVEY_INSTRUCTIONS = """Survey JSON Generator - Return ONLY valid JSON: {"message": "...", "form_data": [...]}
 
 CORE SCHEMA (all fields):
-{{
+{
   "fieldID": "1,2,3...", "fieldTitleId": "UUIDv4", "fieldType": "see_below",
   "title": "Question text", "required": false, "isPublished": false, "isDisabled": false,
   "isDataElementRequired": true, "hideFromAppEnabled": false, "sortOrder": 1,
-  "dynamicColumnEnable": true, "skipRules": {{}}, "calculationRules": {{}},
-  "jumpRules": [], "readonlyRules": {{}}
-}}
+  "dynamicColumnEnable": true, "skipRules": {}, "calculationRules": {},
+  "jumpRules": [], "readonlyRules": {}
+}
 
 FIELD TYPES & EXTRAS:
-• text/tel: +dbColumnName, +dataElementId (same, snake_case, <50 chars), +displayText, +minLength(1), +maxLength(null), +regex(""), +errorMessage(""), +validationFormula({{"queryWithIds":"","queryWithNames":""}}), +hint(""), +defaultValue(null), +enableUniquenessCheckOnAnswer(false), +isTextArea(false), +isNumeric(false)
+• text/tel: +dbColumnName, +dataElementId (same, snake_case, <50 chars), +displayText, +minLength(1), +maxLength(null), +regex(""), +errorMessage(""), +validationFormula({"queryWithIds":"","queryWithNames":""}), +hint(""), +defaultValue(null), +enableUniquenessCheckOnAnswer(false), +isTextArea(false), +isNumeric(false)
 • number/decimal: +dbColumnName, +dataElementId, +displayText, +minValue(null), +maxValue(null), +decimalPrecision(null), +defaultValue(null), +errorMessage(""), +enableUniquenessCheckOnAnswer(false)
 • date: +dbColumnName, +dataElementId, +displayText, +dateOnly(false), +monthOnly(false), +yearOnly(false), +timeOnly(false), +fromDate(""), +toDate(""), +fromDateConfig(""), +toDateConfig(""), +customDatasetFilterEnabled(false), +customDatasetId(""), +customDatasetFromColumn(""), +customDatasetToColumn(""), +isTodayAsDefault(false), +autoCaptureDateEnabled(false), +defaultValue(null), +validationFormula
 • radio/dropdown/checkbox: +dbColumnName, +dataElementId, +displayText, +fieldOptions[], +defaultValue(optionValue OR comma-separated), +isMultiSelect(false), +isInt(false), +errorMessage(""), +enableUniquenessCheckOnAnswer(false), +validationFormula(null for radio/dropdown)
@@ -54,11 +43,11 @@ FIELD TYPES & EXTRAS:
 • geopolygon: +dbColumnName, +dataElementId, +displayText, +maxNumberOfPolygons(1), +validationFormula
 • colorpicker: +dbColumnName, +dataElementId, +displayText, +defaultValue(null)
 • note: ONLY core attrs (NO dbColumnName/dataElementId/displayText)
-• section: +items[] (nested questions), +repeaterSectionConfig:{{"isRepeater":false,"isTabularView":false,"linkDataElementId":null,"repeaterSectionId":"section_fieldID","dbTableName":null,"repeaterLabelDataElementId":"","attributeConfig":{{}},"minItems":0,"UniqueConstraintAttributes":[]}}
+• section: +items[] (nested questions), +repeaterSectionConfig:{"isRepeater":false,"isTabularView":false,"linkDataElementId":null,"repeaterSectionId":"section_fieldID","dbTableName":null,"repeaterLabelDataElementId":"","attributeConfig":{},"minItems":0,"UniqueConstraintAttributes":[]}
   Repeater(isRepeater:true): dbTableName REQUIRED & unique, repeaterLabelDataElementId=comma-separated dataElementIds
 
 OPTION SCHEMA (radio/dropdown/checkbox):
-{{"optionTitle":"Text","optionTitleId":"UUIDv4","optionValue":"code","optionID":"UUIDv4","optionOrder":1,"nextID":"","skipRules":{{}},"titles":{{"default":"Text","undefined":"Text"}}}}
+{"optionTitle":"Text","optionTitleId":"UUIDv4","optionValue":"code","optionID":"UUIDv4","optionOrder":1,"nextID":"","skipRules":{},"titles":{"default":"Text","undefined":"Text"}}
 Auto-generate optionValue as "01","02","03"... if not specified
 
 PUBLISHED FIELD PROTECTION (⚠️ CRITICAL):
@@ -76,11 +65,11 @@ DB NAMING:
 • Unpublished: can update both together
 
 RULES SYNTAX (alasql):
-• skipRules: {{"queryWithNames":"{{dataElementId}}='val'","queryWithIds":"{{dataElementId}}='val'","viewType":"skipRule"}}
-• calculationRules: {{"queryWithNames":"{{field1}}+{{field2}}","queryWithIds":"{{field1}}+{{field2}}","applyWhenQueryWithNames":"","applyWhenQueryWithIds":""}}
-• validationFormula: {{"queryWithNames":"{{id}}='cond'","queryWithIds":"{{id}}='cond'"}}
-• jumpRules: [{{"jumpTo":"END|{{dataElementId}}","queryWithNames":"...","queryWithIds":"..."}}]
-• readonlyRules: {{"queryWithNames":"...","queryWithIds":"..."}}
+• skipRules: {"queryWithNames":"{dataElementId}='val'","queryWithIds":"{dataElementId}='val'","viewType":"skipRule"}
+• calculationRules: {"queryWithNames":"{field1}+{field2}","queryWithIds":"{field1}+{field2}","applyWhenQueryWithNames":"","applyWhenQueryWithIds":""}
+• validationFormula: {"queryWithNames":"{id}='cond'","queryWithIds":"{id}='cond'"}
+• jumpRules: [{"jumpTo":"END|{dataElementId}","queryWithNames":"...","queryWithIds":"..."}]
+• readonlyRules: {"queryWithNames":"...","queryWithIds":"..."}
 Functions: today(), yeardiff(), daydiff(), monthdiff(), getTimeDiff(), IsChecked(), hasAny(), ifElseV2(), isNullOrEmpty(), toInt(), toDouble(), getRepeaterArrayLength(), getRepeaterPropertySum(), ifAnyOfRepeaterItems(), floor(), ceiling()
 
 AUTO-CONFIG:
@@ -94,14 +83,95 @@ FINAL CHECK:
 ✓ Published fields only modified in allowed properties
 ✓ Deletion of published explained in message"""
 
+
+# Shared system message for the chat-completions providers. Keeping the static
+# instructions as a byte-identical first message (all per-request content goes
+# in the user message) lets provider-side prefix caching reuse it across calls.
+_SURVEY_SYSTEM_MESSAGE = {"role": "system", "content": SURVEY_INSTRUCTIONS}
+
+
+class SurveyResponse(BaseModel):
+    """Structured response for survey generation."""
+    message: str
+    form_data: list[Dict[str, Any]]
+
+
+@lru_cache(maxsize=4)
+def create_survey_agent(client_name: ClientName = "openai") -> Agent:
+    """
+    Create a survey generator agent with detailed instructions.
+
+    Cached per client, since the agent configuration never changes.
+    """
+    model = get_model_for_client(client_name)
+
     agent = Agent(
         name="Survey Generator",
-        instructions=instructions,
+        instructions=SURVEY_INSTRUCTIONS,
         model=model,
     )
     return agent
 
 
+def _strip_code_fence(text: str) -> str:
+    """Remove a surrounding ```json ... ``` (or bare ```) fence from model output."""
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.removeprefix('```json').removeprefix('```').removesuffix('```').strip()
+    return text
+
+
+# Generated surveys, keyed on the request and the form it modifies
+SURVEY_CACHE_SIZE = 1024
+_survey_cache = LRUCache(maxsize=SURVEY_CACHE_SIZE)
+
+# LLM calls currently running, by cache key, so identical concurrent requests
+# wait on the same call instead of each starting their own
+_inflight: dict[tuple[str, bytes], asyncio.Task] = {}
+
+
+# Pretty-printed form JSON for the prompt, keyed on the form digest, so a form
+# resent unchanged (iterative edits in the UI) is not serialized again
+FORM_JSON_CACHE_SIZE = 256
+_form_json_cache = LRUCache(maxsize=FORM_JSON_CACHE_SIZE)
+
+
+def _form_digest(existing_form_data: list[Dict[str, Any]] | None) -> bytes:
+    """Hash the canonical (sorted-key) JSON of the form data."""
+    form_json = orjson.dumps(existing_form_data or None, option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(form_json, digest_size=16).digest()
+
+
+def _survey_cache_key(user_request: str, form_digest: bytes, client_name: ClientName) -> tuple[str, bytes]:
+    """Build the survey cache key from the request text and form digest."""
+    digest = hashlib.blake2b(user_request.encode() + b"|" + form_digest, digest_size=16).digest()
+    return (client_name, digest)
+
+
+def _build_prompt(
+    user_request: str,
+    existing_form_data: list[Dict[str, Any]] | None,
+    form_digest: bytes
+) -> str:
+    """Build the user prompt, embedding the existing form data when provided."""
+    if not existing_form_data:
+        return user_request
+
+    form_json = _form_json_cache.get(form_digest)
+    if form_json is None:
+        form_json = orjson.dumps(existing_form_data, option=orjson.OPT_INDENT_2).decode()
+        _form_json_cache.set(form_digest, form_json)
+
+    return f"""Existing form data:
+```json
+{form_json}
+```
+
+User request: {user_request}
+
+Generate the updated form_data with all modifications applied."""
+
+
 async def generate_survey(
     user_request: str,
     existing_form_data: list[Dict[str, Any]] = None,
@@ -110,6 +180,10 @@ async def generate_survey(
     """
     Generate survey JSON based on user request.
 
+    Identical requests (same text, form data and client) are served from an
+    in-process cache instead of calling the LLM again, and concurrent identical
+    requests share a single in-flight LLM call.
+
     Args:
         user_request: Natural language description of the survey fields needed
         existing_form_data: Optional existing form data to modify
@@ -118,8 +192,38 @@ async def generate_survey(
     Returns:
         SurveyResponse with message and form_data
     """
+    form_digest = _form_digest(existing_form_data)
+    cache_key = _survey_cache_key(user_request, form_digest, client_name)
+    cached = _survey_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    task = _inflight.get(cache_key)
+    if task is None:
+        prompt = _build_prompt(user_request, existing_form_data, form_digest)
+        task = asyncio.ensure_future(_generate_and_cache(cache_key, prompt, client_name))
+        _inflight[cache_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(cache_key, None))
+
+    # Shield so one caller disconnecting does not cancel the call for the others
+    return await asyncio.shield(task)
+
+
+async def _generate_and_cache(
+    cache_key: tuple[str, bytes],
+    prompt: str,
+    client_name: ClientName
+) -> SurveyResponse:
+    """Generate a survey and store it in the cache."""
+    result = await _generate_survey_uncached(prompt, client_name)
+    _survey_cache.set(cache_key, result)
+    return result
+
+
+async def _generate_survey_uncached(prompt: str, client_name: ClientName) -> SurveyResponse:
+    """Generate survey JSON for a built prompt by calling the LLM."""
     # Setup client
-    client = get_client(client_name)
+    client, model = get_provider(client_name)
 
     # For OpenAI, use the Agents SDK
     if client_name == "openai":
@@ -128,138 +232,31 @@ async def generate_survey(
         # Create survey agent
         survey_agent = create_survey_agent(client_name)
 
-        # Build the prompt
-        prompt = user_request
-        if existing_form_data:
-            prompt = f"""Existing form data:
-```json
-{json.dumps(existing_form_data, indent=2)}
-```
-
-User request: {user_request}
-
-Generate the updated form_data with all modifications applied."""
-
         # Run the agent - it will return JSON based on instructions
         result = await Runner.run(survey_agent, prompt)
 
-        # Parse the response
-        response_text = result.final_output.strip()
-
-        # Remove markdown code blocks if present
-        if response_text.startswith('```json'):
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
-        elif response_text.startswith('```'):
-            response_text = response_text.replace('```', '').strip()
+        # Parse and validate the response in one pass, removing markdown code
+        # blocks if present
+        response_text = _strip_code_fence(result.final_output)
 
-        parsed_response = json.loads(response_text)
-
-        return SurveyResponse(
-            message=parsed_response["message"],
-            form_data=parsed_response["form_data"]
-        )
+        return SurveyResponse.model_validate_json(response_text)
 
     # For DeepSeek and Gemini, use direct API
     else:
-        model = get_model_for_client(client_name)
-
-        # Build the prompt
-        prompt = user_request
-        if existing_form_data:
-            prompt = f"""Existing form data:
-```json
-{json.dumps(existing_form_data, indent=2)}
-```
-
-User request: {user_request}
-
-Generate the updated form_data with all modifications applied."""
-
-        # Optimized system prompt
-        instructions = f"""Survey JSON Generator - Return ONLY valid JSON: {{"message": "...", "form_data": [...]}}
-
-CORE SCHEMA (all fields):
-{{
-  "fieldID": "1,2,3...", "fieldTitleId": "UUIDv4", "fieldType": "see_below",
-  "title": "Question text", "required": false, "isPublished": false, "isDisabled": false,
-  "isDataElementRequired": true, "hideFromAppEnabled": false, "sortOrder": 1,
-  "dynamicColumnEnable": true, "skipRules": {{}}, "calculationRules": {{}},
-  "jumpRules": [], "readonlyRules": {{}}
-}}
-
-FIELD TYPES & EXTRAS:
-• text/tel: +dbColumnName, +dataElementId (same, snake_case, <50 chars), +displayText, +minLength(1), +maxLength(null), +regex(""), +errorMessage(""), +validationFormula({{"queryWithIds":"","queryWithNames":""}}), +hint(""), +defaultValue(null), +enableUniquenessCheckOnAnswer(false), +isTextArea(false), +isNumeric(false)
-• number/decimal: +dbColumnName, +dataElementId, +displayText, +minValue(null), +maxValue(null), +decimalPrecision(null), +defaultValue(null), +errorMessage(""), +enableUniquenessCheckOnAnswer(false)
-• date: +dbColumnName, +dataElementId, +displayText, +dateOnly(false), +monthOnly(false), +yearOnly(false), +timeOnly(false), +fromDate(""), +toDate(""), +fromDateConfig(""), +toDateConfig(""), +customDatasetFilterEnabled(false), +customDatasetId(""), +customDatasetFromColumn(""), +customDatasetToColumn(""), +isTodayAsDefault(false), +autoCaptureDateEnabled(false), +defaultValue(null), +validationFormula
-• radio/dropdown/checkbox: +dbColumnName, +dataElementId, +displayText, +fieldOptions[], +defaultValue(optionValue OR comma-separated), +isMultiSelect(false), +isInt(false), +errorMessage(""), +enableUniquenessCheckOnAnswer(false), +validationFormula(null for radio/dropdown)
-  checkbox ONLY: +minItemToSelect(""), +maxItemToSelect(""), +minItemToSelectNumber(""), +maxItemToSelectNumber("")
-• boolean: +dbColumnName, +dataElementId, +displayText, +defaultValue(true/false/null), +validationFormula
-• image/video/document: +dbColumnName, +dataElementId, +displayText, +validationFormula
-  image: +maxPhotoUploads, +imageHeight, +imageWidth, +isSizeRestricted, +canChooseFromGallery, +canUploadFromWeb
-  video/document: +maxFileUploads
-• geolocation: +dbColumnName, +dataElementId, +displayText, +latitude(0), +longitude(0), +altitude(0), +precision(0), +autoCaptureGeolocationEnable(true), +validationFormula
-• geopolygon: +dbColumnName, +dataElementId, +displayText, +maxNumberOfPolygons(1), +validationFormula
-• colorpicker: +dbColumnName, +dataElementId, +displayText, +defaultValue(null)
-• note: ONLY core attrs (NO dbColumnName/dataElementId/displayText)
-• section: +items[] (nested questions), +repeaterSectionConfig:{{"isRepeater":false,"isTabularView":false,"linkDataElementId":null,"repeaterSectionId":"section_fieldID","dbTableName":null,"repeaterLabelDataElementId":"","attributeConfig":{{}},"minItems":0,"UniqueConstraintAttributes":[]}}
-  Repeater(isRepeater:true): dbTableName REQUIRED & unique, repeaterLabelDataElementId=comma-separated dataElementIds
-
-OPTION SCHEMA (radio/dropdown/checkbox):
-{{"optionTitle":"Text","optionTitleId":"UUIDv4","optionValue":"code","optionID":"UUIDv4","optionOrder":1,"nextID":"","skipRules":{{}},"titles":{{"default":"Text","undefined":"Text"}}}}
-Auto-generate optionValue as "01","02","03"... if not specified
-
-PUBLISHED FIELD PROTECTION (⚠️ CRITICAL):
-If isPublished=true:
-• CANNOT delete/remove from form_data (MUST preserve)
-• CANNOT change: dbColumnName, dataElementId, fieldType, isPublished
-• CAN modify: title, displayText, required, defaultValue, hint
-• On delete request: keep field, explain in message why not deleted
-• NEVER change isPublished status (true↔false)
-
-DB NAMING:
-• dbColumnName = dataElementId (ALWAYS identical & required)
-• displayText = short UI label (ALWAYS required with dbColumnName)
-• Snake_case, <50 chars, concise ("What is your name?" → "your_name")
-• Unpublished: can update both together
-
-RULES SYNTAX (alasql):
-• skipRules: {{"queryWithNames":"{{dataElementId}}='val'","queryWithIds":"{{dataElementId}}='val'","viewType":"skipRule"}}
-• calculationRules: {{"queryWithNames":"{{field1}}+{{field2}}","queryWithIds":"{{field1}}+{{field2}}","applyWhenQueryWithNames":"","applyWhenQueryWithIds":""}}
-• validationFormula: {{"queryWithNames":"{{id}}='cond'","queryWithIds":"{{id}}='cond'"}}
-• jumpRules: [{{"jumpTo":"END|{{dataElementId}}","queryWithNames":"...","queryWithIds":"..."}}]
-• readonlyRules: {{"queryWithNames":"...","queryWithIds":"..."}}
-Functions: today(), yeardiff(), daydiff(), monthdiff(), getTimeDiff(), IsChecked(), hasAny(), ifElseV2(), isNullOrEmpty(), toInt(), toDouble(), getRepeaterArrayLength(), getRepeaterPropertySum(), ifAnyOfRepeaterItems(), floor(), ceiling()
-
-AUTO-CONFIG:
-• Email: isTextArea=false, isNumeric=false, email regex
-• Textarea: isTextArea=true
-• UUIDv4 for all ID fields
-• sortOrder reindex on reorder (no fieldID changes)
-
-FINAL CHECK:
-✓ All isPublished=true fields present
-✓ Published fields only modified in allowed properties
-✓ Deletion of published explained in message"""
-
         # Call the API with JSON mode
         response = await client.chat.completions.create(
             model=model,
             messages=[
-                {"role": "system", "content": instructions},
+                _SURVEY_SYSTEM_MESSAGE,
                 {"role": "user", "content": prompt}
             ],
             response_format={"type": "json_object"}
         )
 
-        response_text = response.choices[0].message.content.strip()
-
         # Remove markdown code blocks if present
-        if response_text.startswith('```json'):
-            response_text = response_text.replace('```json', '').replace('```', '').strip()
-        elif response_text.startswith('```'):
-            response_text = response_text.replace('```', '').strip()
+        response_text = _strip_code_fence(response.choices[0].message.content)
 
-        parsed_response = json.loads(response_text)
+        parsed_response = orjson.loads(response_text)
 
         return SurveyResponse(
             message=parsed_response.get("message", "Survey generated successfully"),
@@ -267,6 +264,92 @@ FINAL CHECK:
         )
 
 
+async def stream_survey(
+    user_request: str,
+    existing_form_data: list[Dict[str, Any]] | None = None,
+    client_name: ClientName = "openai"
+) -> AsyncIterator[bytes]:
+    """
+    Generate a survey, yielding NDJSON lines as the LLM response arrives.
+
+    Each completed form_data item is emitted as soon as its closing brace is
+    received, so clients can render fields before generation finishes.
+
+    Yields:
+        {"type": "field", "field": {...}} per form_data item, then
+        {"type": "done", "message": "..."}, or {"type": "error", "message": "..."}
+    """
+    form_digest = _form_digest(existing_form_data)
+    cache_key = _survey_cache_key(user_request, form_digest, client_name)
+    cached = _survey_cache.get(cache_key)
+    if cached is not None:
+        for field in cached.form_data:
+            yield _ndjson_line({"type": "field", "field": field})
+        yield _ndjson_line({"type": "done", "message": cached.message})
+        return
+
+    prompt = _build_prompt(user_request, existing_form_data, form_digest)
+    client, model = get_provider(client_name)
+
+    # All providers go through Chat Completions here, since the Agents SDK
+    # path only exposes the final output
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=[
+            _SURVEY_SYSTEM_MESSAGE,
+            {"role": "user", "content": prompt}
+        ],
+        response_format={"type": "json_object"},
+        stream=True
+    )
+
+    parts: list[str] = []
+    fields = ijson.sendable_list()
+    parser = ijson.items_coro(fields, "form_data.item", use_float=True)
+    emitted = 0
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        parts.append(delta)
+        if parser is None:
+            continue
+        try:
+            parser.send(delta.encode())
+        except ijson.JSONError:
+            # Not plain JSON (e.g. wrapped in a code fence): fall back to
+            # parsing the full text once the stream ends
+            parser = None
+            continue
+        for field in fields:
+            yield _ndjson_line({"type": "field", "field": field})
+        emitted += len(fields)
+        del fields[:]
+
+    try:
+        parsed_response = orjson.loads(_strip_code_fence("".join(parts)))
+    except orjson.JSONDecodeError as e:
+        yield _ndjson_line({"type": "error", "message": f"Invalid JSON from model: {e}"})
+        return
+
+    result = SurveyResponse(
+        message=parsed_response.get("message", "Survey generated successfully"),
+        form_data=parsed_response.get("form_data", [])
+    )
+    _survey_cache.set(cache_key, result)
+
+    for field in result.form_data[emitted:]:
+        yield _ndjson_line({"type": "field", "field": field})
+    yield _ndjson_line({"type": "done", "message": result.message})
+
+
+def _ndjson_line(event: Dict[str, Any]) -> bytes:
+    """Serialize one event as a newline-terminated JSON line."""
+    return orjson.dumps(event, option=orjson.OPT_APPEND_NEWLINE)
+
+
 async def demo_survey_generator():
     """Demo function to test survey generator."""
     print("=" * 80)
@@ -291,7 +374,7 @@ All fields should be required."""
         print(f"  - {field['fieldType']}: {field['title']}")
 
     print("\n--- Full JSON Output ---")
-    print(json.dumps({"message": result.message, "form_data": result.form_data}, indent=2))
+    print(orjson.dumps({"message": result.message, "form_data": result.form_data}, option=orjson.OPT_INDENT_2).decode())
 
     print("\n" + "=" * 80)
 
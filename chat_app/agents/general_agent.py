@@ -3,14 +3,12 @@ General Chat Agent
 Handles casual conversations and general queries.
 """
 
+from functools import lru_cache
 from agents import Agent, ModelSettings
 from chat_app.config.settings import DEFAULT_MODEL, MAX_OUTPUT_TOKENS
 
 
-def create_general_agent() -> Agent:
-    """Create a general chat agent for casual conversations."""
-
-    instructions = """You are a friendly and helpful general chat assistant.
+_GENERAL_INSTRUCTIONS = """You are a friendly and helpful general chat assistant.
 
 Your role:
 - Engage in casual, friendly conversations
@@ -31,9 +29,14 @@ Example topics you handle well:
 - Casual conversation and small talk
 """
 
+
+@lru_cache(maxsize=1)
+def create_general_agent() -> Agent:
+    """Create a general chat agent for casual conversations."""
+
     agent = Agent(
         name="General Chat Assistant",
-        instructions=instructions,
+        instructions=_GENERAL_INSTRUCTIONS,
         model=DEFAULT_MODEL,
         model_settings=ModelSettings(max_tokens=MAX_OUTPUT_TOKENS),
     )
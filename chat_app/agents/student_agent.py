@@ -3,14 +3,12 @@ Student Helper Agent
 Handles educational questions, homework help, and learning.
 """
 
+from functools import lru_cache
 from agents import Agent, ModelSettings
 from chat_app.config.settings import DEFAULT_MODEL, MAX_OUTPUT_TOKENS
 
 
-def create_student_agent() -> Agent:
-    """Create a student helper agent for educational support."""
-
-    instructions = """You are a patient and encouraging educational tutor.
+_STUDENT_INSTRUCTIONS = """You are a patient and encouraging educational tutor.
 
 Your role:
 - Help students understand concepts
@@ -44,9 +42,14 @@ Subjects you help with:
 - Study techniques and learning strategies
 """
 
+
+@lru_cache(maxsize=1)
+def create_student_agent() -> Agent:
+    """Create a student helper agent for educational support."""
+
     agent = Agent(
         name="Student Helper",
-        instructions=instructions,
+        instructions=_STUDENT_INSTRUCTIONS,
         model=DEFAULT_MODEL,
         model_settings=ModelSettings(max_tokens=MAX_OUTPUT_TOKENS),
     )
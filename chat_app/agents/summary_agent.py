@@ -0,0 +1,36 @@
+"""
+Conversation Summary Agent
+Condenses older conversation turns into a short running summary.
+"""
+
+from functools import lru_cache
+from agents import Agent, ModelSettings
+from chat_app.config.settings import DEFAULT_MODEL, SUMMARY_MAX_TOKENS
+
+
+_SUMMARY_INSTRUCTIONS = """You maintain a running summary of a conversation between a user and an assistant.
+
+You receive the previous summary (possibly empty) followed by the next conversation turns.
+Return an updated summary that merges both.
+
+Guidelines:
+- Keep facts, decisions, user preferences, and open questions
+- Keep names, code identifiers, numbers, and error messages exactly as written
+- Drop greetings, filler, and repeated content
+- Write plain prose in the third person, at most a few short paragraphs
+- Return only the summary, with no preamble
+"""
+
+
+@lru_cache(maxsize=1)
+def create_summary_agent() -> Agent:
+    """Create an agent that summarizes earlier conversation turns."""
+
+    agent = Agent(
+        name="Conversation Summarizer",
+        instructions=_SUMMARY_INSTRUCTIONS,
+        model=DEFAULT_MODEL,
+        model_settings=ModelSettings(max_tokens=SUMMARY_MAX_TOKENS),
+    )
+
+    return agent
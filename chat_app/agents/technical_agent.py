@@ -3,14 +3,12 @@ Technical Expert Agent
 Handles programming, debugging, and technical questions.
 """
 
+from functools import lru_cache
 from agents import Agent, ModelSettings
 from chat_app.config.settings import DEFAULT_MODEL, MAX_OUTPUT_TOKENS
 
 
-def create_technical_agent() -> Agent:
-    """Create a technical expert agent for programming and technical questions."""
-
-    instructions = """You are a senior software engineer and technical expert.
+_TECHNICAL_INSTRUCTIONS = """You are a senior software engineer and technical expert.
 
 Your role:
 - Help with programming questions in any language
@@ -41,9 +39,14 @@ Response format:
 4. Suggest best practices
 """
 
+
+@lru_cache(maxsize=1)
+def create_technical_agent() -> Agent:
+    """Create a technical expert agent for programming and technical questions."""
+
     agent = Agent(
         name="Technical Expert",
-        instructions=instructions,
+        instructions=_TECHNICAL_INSTRUCTIONS,
         model=DEFAULT_MODEL,
         model_settings=ModelSettings(max_tokens=MAX_OUTPUT_TOKENS),
     )
@@ -7,20 +7,7 @@ from agents import Agent, ModelSettings
 from chat_app.config.settings import DEFAULT_MODEL, MAX_OUTPUT_TOKENS
 
 
-def create_triage_agent(general_agent: Agent, technical_agent: Agent, student_agent: Agent) -> Agent:
-    """
-    Create a triage agent that routes queries to specialized agents.
-
-    Args:
-        general_agent: Agent for general conversations
-        technical_agent: Agent for technical/programming questions
-        student_agent: Agent for educational/learning questions
-
-    Returns:
-        Configured triage agent with handoffs
-    """
-
-    instructions = """You are a routing assistant that directs users to the right specialist.
+_TRIAGE_INSTRUCTIONS = """You are a routing assistant that directs users to the right specialist.
 
 Your ONLY job is to analyze the user's question and transfer them to the appropriate agent:
 
@@ -62,9 +49,23 @@ Decision process:
 Transfer immediately without explanation.
 """
 
+
+def create_triage_agent(general_agent: Agent, technical_agent: Agent, student_agent: Agent) -> Agent:
+    """
+    Create a triage agent that routes queries to specialized agents.
+
+    Args:
+        general_agent: Agent for general conversations
+        technical_agent: Agent for technical/programming questions
+        student_agent: Agent for educational/learning questions
+
+    Returns:
+        Configured triage agent with handoffs
+    """
+
     agent = Agent(
         name="Triage Assistant",
-        instructions=instructions,
+        instructions=_TRIAGE_INSTRUCTIONS,
         model=DEFAULT_MODEL,
         model_settings=ModelSettings(max_tokens=MAX_OUTPUT_TOKENS),
         handoffs=[general_agent, technical_agent, student_agent],
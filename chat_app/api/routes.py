@@ -3,20 +3,38 @@ API Routes for Chat Application
 Handles chat requests and agent orchestration with streaming support.
 """
 
-import json
-from typing import Optional, AsyncGenerator
+import asyncio
+import logging
+from typing import Optional, AsyncGenerator, AsyncIterator
+import orjson
 from pydantic import BaseModel
 from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
-from agents import Runner, set_default_openai_client
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from agents import (
+    Agent,
+    AgentUpdatedStreamEvent,
+    RawResponsesStreamEvent,
+    Runner,
+    set_default_openai_client,
+)
+from openai.types.responses import ResponseTextDeltaEvent
 
 from chat_app.agents.general_agent import create_general_agent
 from chat_app.agents.technical_agent import create_technical_agent
 from chat_app.agents.student_agent import create_student_agent
 from chat_app.agents.triage_agent import create_triage_agent
-from chat_app.services.session_manager import session_manager
+from chat_app.agents.summary_agent import create_summary_agent
+from chat_app.config.settings import (
+    AMBIGUOUS_ROUTE,
+    fast_route,
+    STREAM_FLUSH_CHARS,
+    STREAM_FLUSH_INTERVAL_SECONDS,
+)
+from chat_app.services.session_manager import Session, session_manager
 from app.get_client import get_client
 
+logger = logging.getLogger(__name__)
+
 
 # Request/Response Models
 class ChatRequest(BaseModel):
@@ -35,117 +53,235 @@ class ChatResponse(BaseModel):
 
 
 # Create router
-router = APIRouter(prefix="/api/chat", tags=["Chat API"])
+router = APIRouter(prefix="/api/chat", tags=["Chat API"], default_response_class=ORJSONResponse)
 
 
-# Initialize agents (singleton pattern)
-_agents_initialized = False
+# Agents, created once at application startup by initialize_agents()
 _triage_agent = None
+_specialist_agents: dict[str, Agent] = {}
+_agents_by_name: dict[str, Agent] = {}
+_agents_init_error: Optional[str] = None
 
 
 def initialize_agents():
-    """Initialize all agents (called once)."""
-    global _agents_initialized, _triage_agent
+    """Initialize all agents (called once from the application lifespan)."""
+    global _triage_agent, _agents_init_error
 
-    if not _agents_initialized:
-        # Setup OpenAI client
+    # Setup OpenAI client
+    try:
         client = get_client("openai")
-        set_default_openai_client(client)
-
-        # Create specialized agents
-        general_agent = create_general_agent()
-        technical_agent = create_technical_agent()
-        student_agent = create_student_agent()
-
-        # Create triage agent with handoffs
-        _triage_agent = create_triage_agent(
-            general_agent=general_agent,
-            technical_agent=technical_agent,
-            student_agent=student_agent
+    except ValueError as e:
+        # Kept so chat requests can report why the agents are unavailable
+        _agents_init_error = str(e)
+        raise
+    set_default_openai_client(client)
+
+    # Create specialized agents
+    general_agent = create_general_agent()
+    technical_agent = create_technical_agent()
+    student_agent = create_student_agent()
+
+    # Create triage agent with handoffs
+    _triage_agent = create_triage_agent(
+        general_agent=general_agent,
+        technical_agent=technical_agent,
+        student_agent=student_agent
+    )
+
+    # Specialists reachable directly by keyword routing
+    _specialist_agents["technical"] = technical_agent
+    _specialist_agents["student"] = student_agent
+
+    # Specialists a session can stay pinned to after its first hand-off; the
+    # general agent is the catch-all with no handoffs, so it is never pinned
+    for agent in (technical_agent, student_agent):
+        _agents_by_name[agent.name] = agent
+
+
+def _require_agents() -> None:
+    """Fail the request with 503 if the agents could not be initialized at startup."""
+    if _triage_agent is None:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Chat agents are not available: {_agents_init_error or 'not initialized'}"
         )
 
-        _agents_initialized = True
+
+# Strong references to running compaction tasks so they are not garbage collected
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _schedule_compaction(session: Session) -> None:
+    """Summarize older session history in the background, off the response path."""
+    task = asyncio.create_task(_compact_session(session))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _compact_session(session: Session) -> None:
+    try:
+        await session.compact(create_summary_agent())
+    except Exception:
+        logger.exception("Compacting session %s failed", session.session_id)
+
+
+def _select_agent(message: str, session: Session) -> Agent:
+    """
+    Pick the agent to run for this turn.
+
+    Obvious queries go straight to a specialist and ambiguous ones through
+    triage. Queries with no keyword stay with the specialist that answered the
+    last turn, or go through triage when there is none.
+    """
+    category = fast_route(message)
+    if category == AMBIGUOUS_ROUTE:
+        return _triage_agent
+    if category is not None:
+        return _specialist_agents[category]
+    return _agents_by_name.get(session.current_agent_name, _triage_agent)
+
+
+def _sse(event: dict) -> bytes:
+    """Encode an event as a Server-Sent Events data frame."""
+    return b"data: " + orjson.dumps(event) + b"\n\n"
+
+
+# Content deltas are the bulk of the stream, so their frame is built directly
+_SSE_CONTENT_PREFIX = b'data: {"type":"content","content":'
+
+
+def _sse_content(content: str) -> bytes:
+    """Encode a content delta frame without building an event dict."""
+    return _SSE_CONTENT_PREFIX + orjson.dumps(content) + b"}\n\n"
+
+
+def _chat_completions_delta_text(data) -> Optional[str]:
+    """Extract delta text from a Chat Completions streaming chunk (fallback format)."""
+    choices = getattr(data, 'choices', None)
+    if not choices:
+        return None
+    delta = getattr(choices[0], 'delta', None)
+    return getattr(delta, 'content', None) if delta else None
 
 
 async def stream_response(
     message: str,
     session_id: Optional[str] = None
-) -> AsyncGenerator[str, None]:
+) -> AsyncGenerator[bytes, None]:
     """
     Stream the agent response using Server-Sent Events format.
     """
-    initialize_agents()
-
     # Get or create session
     session = session_manager.get_or_create_session(session_id)
 
-    # Add user message to history
-    session.add_message("user", message)
-
-    # Get conversation history
-    history = session.get_history_for_agent()
-
-    full_response = ""
-    current_agent = "Triage Assistant"
+    # Hold the session lock for the whole turn so concurrent requests on the
+    # same session cannot interleave their history updates
+    async with session.lock:
+        # Add user message to history
+        session.add_message("user", message)
 
-    try:
-        # Send session ID first
-        yield f"data: {json.dumps({'type': 'session', 'session_id': session.session_id})}\n\n"
-
-        # Stream the agent response
-        result = Runner.run_streamed(_triage_agent, history)
-
-        # Process stream events
-        async for event in result.stream_events():
-            event_type = getattr(event, 'type', '')
-
-            # Handle agent changes
-            if event_type == 'agent_updated_stream_event':
-                current_agent = event.new_agent.name
-                yield f"data: {json.dumps({'type': 'agent', 'agent': current_agent})}\n\n"
-
-            # Handle raw streaming responses from LLM (OpenAI Responses API format)
-            elif event_type == 'raw_response_event':
-                data = event.data
-                data_type = getattr(data, 'type', '')
-
-                # Handle text delta events (response.output_text.delta)
-                if data_type == 'response.output_text.delta':
-                    delta = getattr(data, 'delta', '')
-                    if delta:
-                        full_response += delta
-                        yield f"data: {json.dumps({'type': 'content', 'content': delta})}\n\n"
-
-                # Handle Chat Completions streaming format (fallback)
-                elif hasattr(data, 'choices') and data.choices:
-                    choice = data.choices[0]
-                    delta = getattr(choice, 'delta', None)
-                    if delta:
-                        content = getattr(delta, 'content', None)
-                        if content:
-                            full_response += content
-                            yield f"data: {json.dumps({'type': 'content', 'content': content})}\n\n"
-
-        # Get final agent name
-        try:
-            current_agent = result.last_agent.name
-        except Exception:
-            pass
+        # Get conversation history
+        history = session.get_history_for_agent()
 
-        # If no streaming content was captured, use final output
-        if not full_response and result.final_output:
-            full_response = str(result.final_output)
-            yield f"data: {json.dumps({'type': 'content', 'content': full_response})}\n\n"
+        # Streamed text is joined once at the end rather than concatenated per delta
+        parts: list[str] = []
+        current_agent = "Triage Assistant"
 
-        # Add response to session history
-        session.add_message("assistant", full_response, agent_used=current_agent)
+        # Deltas are buffered and flushed as one frame per size/time window; the
+        # first delta is sent immediately so time to first token is unchanged
+        loop = asyncio.get_running_loop()
+        pending: list[str] = []
+        pending_len = 0
+        last_flush = float("-inf")
 
-        # Send completion event
-        yield f"data: {json.dumps({'type': 'done', 'agent': current_agent})}\n\n"
+        try:
+            # Send session ID first
+            yield _sse({"type": "session", "session_id": session.session_id})
+
+            # Stream the agent response, skipping triage when the route is known
+            result = Runner.run_streamed(_select_agent(message, session), history)
+
+            # Consume events directly in this generator (no forwarding task), so
+            # the stream stays on the request's own task
+            async for event in result.stream_events():
+                # Dispatch on the event class rather than probing string type
+                # attributes; raw deltas are by far the most frequent, so test first
+                event_cls = type(event)
+
+                # Handle raw streaming responses from LLM
+                if event_cls is RawResponsesStreamEvent:
+                    data = event.data
+                    if type(data) is ResponseTextDeltaEvent:
+                        text = data.delta
+                    else:
+                        text = _chat_completions_delta_text(data)
+
+                    if text:
+                        parts.append(text)
+                        pending.append(text)
+                        pending_len += len(text)
+                        now = loop.time()
+                        if pending_len >= STREAM_FLUSH_CHARS or now - last_flush >= STREAM_FLUSH_INTERVAL_SECONDS:
+                            yield _sse_content("".join(pending))
+                            pending.clear()
+                            pending_len = 0
+                            last_flush = now
+
+                # Handle agent changes
+                elif event_cls is AgentUpdatedStreamEvent:
+                    # Flush text from the previous agent before announcing the new one
+                    if pending:
+                        yield _sse_content("".join(pending))
+                        pending.clear()
+                        pending_len = 0
+                    current_agent = event.new_agent.name
+                    yield _sse({"type": "agent", "agent": current_agent})
+
+            # Flush whatever is left of the last window
+            if pending:
+                yield _sse_content("".join(pending))
+
+            # Get final agent name
+            try:
+                current_agent = result.last_agent.name
+            except Exception:
+                pass
+
+            full_response = "".join(parts)
+
+            # If no streaming content was captured, use final output
+            if not full_response and result.final_output:
+                full_response = str(result.final_output)
+                yield _sse_content(full_response)
+
+            # Add response to session history
+            session.add_message("assistant", full_response, agent_used=current_agent)
+            _schedule_compaction(session)
+
+            # Send completion event
+            yield _sse({"type": "done", "agent": current_agent})
+
+        except Exception as e:
+            error_msg = str(e)
+            yield _sse({"type": "error", "error": error_msg})
+
+
+# Disable caching and proxy buffering so frames reach the client as they are sent
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+
+def _sse_response(frames: AsyncIterator[bytes]) -> StreamingResponse:
+    """
+    Wrap an async frame iterator in an SSE StreamingResponse.
 
-    except Exception as e:
-        error_msg = str(e)
-        yield f"data: {json.dumps({'type': 'error', 'error': error_msg})}\n\n"
+    Frames must come from an async iterator: Starlette iterates sync ones in a
+    threadpool, one thread hop per frame.
+    """
+    return StreamingResponse(frames, media_type="text/event-stream", headers=_SSE_HEADERS)
 
 
 @router.post("/stream")
@@ -155,15 +291,8 @@ async def stream_message(request: ChatRequest):
 
     The response is streamed in real-time as the agent generates it.
     """
-    return StreamingResponse(
-        stream_response(request.message, request.session_id),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        }
-    )
+    _require_agents()
+    return _sse_response(stream_response(request.message, request.session_id))
 
 
 @router.get("/stream")
@@ -174,15 +303,8 @@ async def stream_message_get(
     """
     Stream a message response using Server-Sent Events (GET method for EventSource).
     """
-    return StreamingResponse(
-        stream_response(message, session_id),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        }
-    )
+    _require_agents()
+    return _sse_response(stream_response(message, session_id))
 
 
 @router.post("/message", response_model=ChatResponse)
@@ -199,35 +321,39 @@ async def send_message(request: ChatRequest) -> ChatResponse:
     Returns:
         ChatResponse with agent reply and session_id
     """
-    try:
-        # Initialize agents if needed
-        initialize_agents()
+    _require_agents()
 
+    try:
         # Get or create session for conversation memory
         session = session_manager.get_or_create_session(request.session_id)
 
-        # Add user message to history
-        session.add_message("user", request.message)
+        # Serialize turns on this session so history updates stay paired
+        async with session.lock:
+            # Add user message to history
+            session.add_message("user", request.message)
 
-        # Get conversation history for context
-        history = session.get_history_for_agent()
+            # Get conversation history for context
+            history = session.get_history_for_agent()
 
-        # Run the triage agent with conversation history
-        result = await Runner.run(_triage_agent, history)
+            # Run with conversation history, skipping triage when the route is known
+            result = await Runner.run(_select_agent(request.message, session), history)
 
-        # Extract response
-        response_text = result.final_output
-        agent_name = result.last_agent.name if hasattr(result, 'last_agent') else "Triage Assistant"
+            # Extract response
+            response_text = result.final_output
+            agent_name = result.last_agent.name if hasattr(result, 'last_agent') else "Triage Assistant"
 
-        # Add assistant response to history
-        session.add_message("assistant", response_text, agent_used=agent_name)
+            # Add assistant response to history
+            session.add_message("assistant", response_text, agent_used=agent_name)
+            _schedule_compaction(session)
 
-        return ChatResponse(
-            response=response_text,
-            agent_used=agent_name,
-            success=True,
-            session_id=session.session_id
-        )
+            response = ChatResponse(
+                response=response_text,
+                agent_used=agent_name,
+                success=True,
+                session_id=session.session_id
+            )
+            # Already a validated model, so skip response_model re-validation
+            return ORJSONResponse(response.model_dump())
 
     except Exception as e:
         raise HTTPException(
@@ -272,15 +398,15 @@ async def get_session_history(session_id: str):
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    return {
+    return ORJSONResponse({
         "session_id": session_id,
         "messages": [
             {
                 "role": msg.role,
                 "content": msg.content,
                 "agent_used": msg.agent_used,
-                "timestamp": msg.timestamp.isoformat()
+                "timestamp": msg.timestamp_iso
             }
             for msg in session.messages
         ]
-    }
+    })
@@ -2,7 +2,8 @@
 Configuration settings for the chat application.
 """
 
-from typing import Literal
+import re
+from typing import Literal, Optional
 
 # AI Model Configuration
 DEFAULT_MODEL = "gpt-4o-mini"
@@ -12,7 +13,16 @@ MAX_OUTPUT_TOKENS = 1024  # Limit response length
 
 # Session Configuration
 SESSION_TIMEOUT_MINUTES = 30  # Clear session after inactivity
+SESSION_SWEEP_INTERVAL_SECONDS = 30  # Minimum time between expired-session sweeps
+MAX_SESSIONS = 10_000  # Least recently used sessions are evicted beyond this
 MAX_HISTORY_MESSAGES = 20  # Keep last N messages in context
+SUMMARY_TRIGGER_MESSAGES = 12  # Summarize once this many messages are unsummarized
+SUMMARY_TAIL_MESSAGES = 6  # Most recent messages always sent verbatim
+SUMMARY_MAX_TOKENS = 512  # Limit running summary length
+
+# Streaming Configuration
+STREAM_FLUSH_CHARS = 64  # Flush buffered deltas once this many characters are pending
+STREAM_FLUSH_INTERVAL_SECONDS = 0.015  # ...or once this long has passed since the last flush
 
 # Agent Types
 AgentType = Literal["triage", "general", "technical", "student"]
@@ -31,6 +41,40 @@ STUDENT_KEYWORDS = [
     "understand", "concept", "basics", "beginner", "teach"
 ]
 
+
+def _keyword_pattern(keywords: list[str]) -> re.Pattern:
+    """Compile keywords into one case-insensitive whole-word alternation."""
+    # Lookarounds instead of \b so keywords ending in symbols ("c++") still match
+    alternation = "|".join(map(re.escape, keywords))
+    return re.compile(rf"(?<!\w)(?:{alternation})(?!\w)", re.IGNORECASE)
+
+
+TECH_RE = _keyword_pattern(TECHNICAL_KEYWORDS)
+STUDENT_RE = _keyword_pattern(STUDENT_KEYWORDS)
+
+
+# fast_route result when both keyword sets match
+AMBIGUOUS_ROUTE = "ambiguous"
+
+
+def fast_route(message: str) -> Optional[str]:
+    """
+    Route obvious queries by keyword, without an LLM call.
+
+    Returns:
+        "technical" or "student" when only that category's keywords match,
+        AMBIGUOUS_ROUTE when both match, None when neither matches.
+    """
+    is_technical = TECH_RE.search(message) is not None
+    is_student = STUDENT_RE.search(message) is not None
+    if is_technical and is_student:
+        return AMBIGUOUS_ROUTE
+    if is_technical:
+        return "technical"
+    if is_student:
+        return "student"
+    return None
+
 # UI Configuration
 APP_TITLE = "Multi-Agent Chat Assistant"
 APP_DESCRIPTION = """
@@ -3,63 +3,143 @@ Session Manager for Conversation Memory
 Manages conversation history per session with automatic cleanup.
 """
 
+import asyncio
+import time
 import uuid
-from datetime import datetime, timedelta
+from collections import OrderedDict, deque
+from datetime import datetime
 from typing import Optional
 from dataclasses import dataclass, field
+from itertools import islice
 
-from chat_app.config.settings import SESSION_TIMEOUT_MINUTES, MAX_HISTORY_MESSAGES
+from agents import Agent, Runner
 
+from chat_app.config.settings import (
+    SESSION_TIMEOUT_MINUTES,
+    MAX_HISTORY_MESSAGES,
+    SUMMARY_TRIGGER_MESSAGES,
+    SUMMARY_TAIL_MESSAGES,
+    SESSION_SWEEP_INTERVAL_SECONDS,
+    MAX_SESSIONS,
+)
 
-@dataclass
+
+@dataclass(slots=True)
 class Message:
     """Represents a single message in the conversation."""
     role: str  # "user" or "assistant"
     content: str
     timestamp: datetime = field(default_factory=datetime.now)
     agent_used: Optional[str] = None
+    timestamp_iso: str = field(init=False, repr=False)  # Cached for history responses
+
+    def __post_init__(self) -> None:
+        self.timestamp_iso = self.timestamp.isoformat()
 
 
-@dataclass
+@dataclass(slots=True)
 class Session:
     """Represents a user session with conversation history."""
     session_id: str
-    messages: list[Message] = field(default_factory=list)
+    # Bounded deques drop the oldest entry in O(1) once MAX_HISTORY_MESSAGES is reached
+    messages: deque[Message] = field(default_factory=lambda: deque(maxlen=MAX_HISTORY_MESSAGES))
     created_at: datetime = field(default_factory=datetime.now)
-    last_activity: datetime = field(default_factory=datetime.now)
+    # For expiry only; refreshed by SessionManager.get_session together with the
+    # session's recency position, so dict order always matches expiry order
+    last_activity_mono: float = field(default_factory=time.monotonic)
+    current_agent_name: Optional[str] = None  # Agent that answered the last turn
+    summary: str = ""  # Running summary of messages before summary_upto_index
+    summary_upto_index: int = 0
+    # System message carrying the summary; only replaced when the summary changes
+    _summary_message: Optional[dict] = field(default=None, repr=False)
+    # Serializes turns within this session without blocking other sessions
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+    _compacting: bool = field(default=False, repr=False)
+    # Agent-format copy of messages, kept in step so history is not rebuilt per turn
+    _agent_history: deque[dict] = field(
+        default_factory=lambda: deque(maxlen=MAX_HISTORY_MESSAGES), repr=False
+    )
 
     def add_message(self, role: str, content: str, agent_used: Optional[str] = None) -> None:
-        """Add a message to the session history."""
-        self.messages.append(Message(role=role, content=content, agent_used=agent_used))
-        self.last_activity = datetime.now()
+        """Add a message to the session history, keeping only the last N messages."""
+        if len(self.messages) == MAX_HISTORY_MESSAGES:
+            # The append below drops the oldest message
+            self.summary_upto_index = max(0, self.summary_upto_index - 1)
 
-        # Keep only the last N messages
-        if len(self.messages) > MAX_HISTORY_MESSAGES:
-            self.messages = self.messages[-MAX_HISTORY_MESSAGES:]
+        self.messages.append(Message(role=role, content=content, agent_used=agent_used))
+        self._agent_history.append({"role": role, "content": content})
+        if role == "assistant" and agent_used:
+            self.current_agent_name = agent_used
 
     def get_history_for_agent(self) -> list[dict]:
-        """Get conversation history in format suitable for the agent."""
-        return [
-            {"role": msg.role, "content": msg.content}
-            for msg in self.messages
-        ]
+        """
+        Get conversation history in format suitable for the agent.
+
+        Messages already folded into the running summary are replaced by a
+        single system message carrying that summary. The order is stable
+        prefix first (summary), then the append-only recent turns, so
+        consecutive turns share a byte-identical prefix for provider-side
+        prompt caching until the next compaction.
+        """
+        recent = islice(self._agent_history, self.summary_upto_index, None)
+        if self._summary_message is None:
+            return list(recent)
+        return [self._summary_message, *recent]
+
+    async def compact(self, summarizer_agent: Agent) -> None:
+        """
+        Fold older messages into the running summary.
+
+        Runs only once more than SUMMARY_TRIGGER_MESSAGES messages are
+        unsummarized, and always leaves the last SUMMARY_TAIL_MESSAGES verbatim.
+        """
+        end = len(self.messages) - SUMMARY_TAIL_MESSAGES
+        if self._compacting or len(self.messages) - self.summary_upto_index <= SUMMARY_TRIGGER_MESSAGES:
+            return
+
+        self._compacting = True
+        try:
+            to_summarize = list(islice(self.messages, self.summary_upto_index, end))
+            transcript = "\n".join(f"{msg.role}: {msg.content}" for msg in to_summarize)
+            prompt = f"Previous summary:\n{self.summary or '(none)'}\n\nConversation turns:\n{transcript}"
+            result = await Runner.run(summarizer_agent, prompt)
+
+            # Messages may have been added (and old ones truncated) meanwhile,
+            # so locate the last summarized message again
+            last = to_summarize[-1]
+            self.summary_upto_index = next(
+                (i + 1 for i in range(len(self.messages) - 1, -1, -1) if self.messages[i] is last),
+                0,
+            )
+            self.summary = str(result.final_output).strip()
+            self._summary_message = {
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{self.summary}",
+            }
+        finally:
+            self._compacting = False
 
     def is_expired(self) -> bool:
         """Check if session has expired due to inactivity."""
-        timeout = timedelta(minutes=SESSION_TIMEOUT_MINUTES)
-        return datetime.now() - self.last_activity > timeout
+        return time.monotonic() - self.last_activity_mono > SESSION_TIMEOUT_MINUTES * 60
 
 
 class SessionManager:
     """Manages multiple user sessions with automatic cleanup."""
 
     def __init__(self):
-        self._sessions: dict[str, Session] = {}
+        # Ordered least to most recently used, so expired sessions sit at the front
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._last_sweep = time.monotonic()
 
     def create_session(self) -> str:
         """Create a new session and return its ID."""
-        session_id = str(uuid.uuid4())
+        session_id = uuid.uuid4().hex
         self._sessions[session_id] = Session(session_id=session_id)
+
+        # Bound memory regardless of expiry by evicting least recently used sessions
+        while len(self._sessions) > MAX_SESSIONS:
+            self._sessions.popitem(last=False)
         return session_id
 
     def get_session(self, session_id: str) -> Optional[Session]:
@@ -70,10 +150,16 @@ class SessionManager:
         if session.is_expired():
             self.delete_session(session_id)
             return None
+        session.last_activity_mono = time.monotonic()
+        self._sessions.move_to_end(session_id)
         return session
 
     def get_or_create_session(self, session_id: Optional[str] = None) -> Session:
         """Get existing session or create a new one."""
+        # Sweep opportunistically instead of relying on an external scheduler
+        if time.monotonic() - self._last_sweep > SESSION_SWEEP_INTERVAL_SECONDS:
+            self.cleanup_expired_sessions()
+
         if session_id:
             session = self.get_session(session_id)
             if session:
@@ -110,14 +196,21 @@ class SessionManager:
         return False
 
     def cleanup_expired_sessions(self) -> int:
-        """Remove all expired sessions and return count of removed."""
-        expired = [
-            sid for sid, session in self._sessions.items()
-            if session.is_expired()
-        ]
-        for sid in expired:
-            del self._sessions[sid]
-        return len(expired)
+        """
+        Remove expired sessions and return count of removed.
+
+        Sessions are kept in recency order, so the sweep stops at the first
+        one that is still active.
+        """
+        self._last_sweep = time.monotonic()
+        removed = 0
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if not session.is_expired():
+                break
+            self._sessions.popitem(last=False)
+            removed += 1
+        return removed
 
     def get_session_count(self) -> int:
         """Get the number of active sessions."""